@@ -3,6 +3,9 @@
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
+import functools
+import io
 import os
 import re
 import shlex
@@ -10,6 +13,7 @@ import shutil
 import subprocess
 import sys
 import tempfile
+from collections.abc import Iterable
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -18,6 +22,50 @@ REPO_ROOT = Path(__file__).resolve().parents[3]
 SKILL_ROOT = Path(__file__).resolve().parents[1]
 TEMPLATES_DIR = SKILL_ROOT / "assets" / "templates"
 
+_KEBAB_NONALNUM = re.compile(r"[^a-z0-9]+")
+_KEBAB_DASHES = re.compile(r"-{2,}")
+_OUTVAR_RE = re.compile(r"[A-Za-z0-9_]+")
+_TMPL_RE = re.compile(r"\{\{(\w+)\}\}")
+
+_EXPORT_PREFIX = "export "
+_EXPORT_PREFIX_LEN = len(_EXPORT_PREFIX)
+
+_CAT_DIR = {
+    "applications": "Applications",
+    "scripts": "Scripts",
+    "monitors": "Monitors",
+}
+_OS_DIR = {
+    "windows": "Windows",
+    "macos": "macOS",
+    "linux": "Linux",
+}
+# os_name -> (extra path components under components/<category>, file suffix)
+_DEST_LAYOUT = {
+    "windows": ((), ".ps1"),
+    "macos": (("macOS",), ".sh"),
+    "linux": (("Linux",), ".sh"),
+}
+_TEMPLATE_FILES = {
+    "windows": {
+        "applications": "powershell-application.ps1.tmpl",
+        "scripts": "powershell-script.ps1.tmpl",
+        "monitors": "powershell-monitor.ps1.tmpl",
+    },
+    "posix": {
+        "applications": "bash-application.sh.tmpl",
+        "scripts": "bash-script.sh.tmpl",
+        "monitors": "bash-monitor.sh.tmpl",
+    },
+}
+
+_MONITOR_MARKERS = (
+    "<-Start Diagnostic->",
+    "<-End Diagnostic->",
+    "<-Start Result->",
+    "<-End Result->",
+)
+
 
 class RmmError(RuntimeError):
     pass
@@ -27,11 +75,19 @@ def eprint(*args: object) -> None:
     print(*args, file=sys.stderr)
 
 
+def open_text_for_read(path: Path) -> io.TextIOWrapper:
+    f = path.open("r", encoding="utf-8", errors="replace")
+    # TextIOWrapper decodes in 8 KiB chunks by default; bump to 1 MiB so
+    # large captured stdout is read with far fewer syscalls.
+    f._CHUNK_SIZE = 1 << 20  # type: ignore[attr-defined]
+    return f
+
+
 def normalize_kebab(raw: str) -> str:
     value = raw.strip().lower()
-    value = re.sub(r"[^a-z0-9]+", "-", value)
+    value = _KEBAB_NONALNUM.sub("-", value)
     value = value.strip("-")
-    value = re.sub(r"-{2,}", "-", value)
+    value = _KEBAB_DASHES.sub("-", value)
     if not value:
         raise RmmError(f"Invalid name '{raw}': produced an empty filename after normalization")
     return value
@@ -39,111 +95,134 @@ def normalize_kebab(raw: str) -> str:
 
 def validate_output_var(output_var: str) -> str:
     output_var = output_var.strip()
-    if not re.fullmatch(r"[A-Za-z0-9_]+", output_var):
+    if not _OUTVAR_RE.fullmatch(output_var):
         raise RmmError(
             f"Invalid --output-var '{output_var}'. Use only letters, digits, and underscore (example: Status)."
         )
     return output_var
 
 
+def _output_var_arg(value: str) -> str:
+    try:
+        return validate_output_var(value)
+    except RmmError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+
 def category_dir(category: str) -> str:
-    mapping = {
-        "applications": "Applications",
-        "scripts": "Scripts",
-        "monitors": "Monitors",
-    }
     try:
-        return mapping[category]
+        return _CAT_DIR[category]
     except KeyError as exc:
         raise RmmError(f"Unknown category: {category}") from exc
 
 
 def os_dir(os_name: str) -> str:
-    mapping = {
-        "windows": "Windows",
-        "macos": "macOS",
-        "linux": "Linux",
-    }
     try:
-        return mapping[os_name]
+        return _OS_DIR[os_name]
     except KeyError as exc:
         raise RmmError(f"Unknown OS: {os_name}") from exc
 
 
 def template_path(os_name: str, category: str) -> Path:
-    if os_name == "windows":
-        return {
-            "applications": TEMPLATES_DIR / "powershell-application.ps1.tmpl",
-            "scripts": TEMPLATES_DIR / "powershell-script.ps1.tmpl",
-            "monitors": TEMPLATES_DIR / "powershell-monitor.ps1.tmpl",
-        }[category]
-    return {
-        "applications": TEMPLATES_DIR / "bash-application.sh.tmpl",
-        "scripts": TEMPLATES_DIR / "bash-script.sh.tmpl",
-        "monitors": TEMPLATES_DIR / "bash-monitor.sh.tmpl",
-    }[category]
+    flavor = "windows" if os_name == "windows" else "posix"
+    return TEMPLATES_DIR / _TEMPLATE_FILES[flavor][category]
 
 
 def destination_path(os_name: str, category: str, filename: str) -> Path:
     cat_dir = category_dir(category)
-    if os_name == "windows":
-        return REPO_ROOT / "components" / cat_dir / f"{filename}.ps1"
-    if os_name == "macos":
-        return REPO_ROOT / "components" / cat_dir / "macOS" / f"{filename}.sh"
-    if os_name == "linux":
-        return REPO_ROOT / "components" / cat_dir / "Linux" / f"{filename}.sh"
-    raise RmmError(f"Unknown OS: {os_name}")
+    try:
+        subdirs, suffix = _DEST_LAYOUT[os_name]
+    except KeyError as exc:
+        raise RmmError(f"Unknown OS: {os_name}") from exc
+    return REPO_ROOT.joinpath("components", cat_dir, *subdirs, f"{filename}{suffix}")
+
+
+@functools.lru_cache(maxsize=16)
+def _load_template(path_str: str, mtime_ns: int) -> str:
+    # mtime_ns keys the cache so an edited template is re-read.
+    return Path(path_str).read_text(encoding="utf-8")
+
+
+def load_template(path: Path) -> str:
+    return _load_template(str(path), path.stat().st_mtime_ns)
 
 
 def render_template(template_text: str, substitutions: dict[str, str]) -> str:
-    rendered = template_text
-    for key, value in substitutions.items():
-        rendered = rendered.replace(f"{{{{{key}}}}}", value)
-    return rendered
+    # Single pass over the template; unknown {{KEY}} placeholders are left as-is.
+    return _TMPL_RE.sub(lambda m: substitutions.get(m.group(1), m.group(0)), template_text)
 
 
 def ensure_parent_dir(path: Path, dry_run: bool) -> None:
     if dry_run:
         return
-    path.parent.mkdir(parents=True, exist_ok=True)
+    os.makedirs(os.fspath(path.parent), exist_ok=True)
 
 
 def copy_attachments(attachments_dir: Path, workdir: Path) -> None:
     if not attachments_dir.exists() or not attachments_dir.is_dir():
         raise RmmError(f"--attachments must be a directory: {attachments_dir}")
-    for child in attachments_dir.iterdir():
-        if child.is_file():
-            shutil.copy2(child, workdir / child.name)
+    # scandir's DirEntry.is_file uses metadata cached from the directory
+    # read, avoiding the extra stat() per entry that iterdir incurs.
+    with os.scandir(attachments_dir) as it:
+        files = [(entry.path, entry.name) for entry in it if entry.is_file(follow_symlinks=False)]
+    if len(files) <= 1:
+        for src, name in files:
+            shutil.copy2(src, workdir / name)
+        return
+    # copy2 defers to the OS fast-copy path; overlapping the copies hides
+    # per-file latency when simulating many small attachments.
+    max_workers = min(8, os.cpu_count() or 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(shutil.copy2, src, workdir / name) for src, name in files]
+        for future in futures:
+            future.result()
 
 
 def parse_env_file(env_path: Path) -> dict[str, str]:
     if not env_path.exists():
         raise RmmError(f"--vars file not found: {env_path}")
     env: dict[str, str] = {}
-    for raw_line in env_path.read_text(encoding="utf-8").splitlines():
-        line = raw_line.strip()
-        if not line or line.startswith("#"):
-            continue
-        if line.startswith("export "):
-            line = line[len("export ") :].strip()
-        if "=" not in line:
-            raise RmmError(f"Invalid env line (expected KEY=VALUE): {raw_line}")
-        key, value = line.split("=", 1)
-        key = key.strip()
-        value = value.strip()
-        if not key:
-            raise RmmError(f"Invalid env line (empty key): {raw_line}")
-        if value.startswith(("'", '"')):
+    with env_path.open("r", encoding="utf-8") as f:
+        for raw_line in f:
+            env_line = _parse_env_line(raw_line)
+            if env_line is not None:
+                key, value = env_line
+                env[key] = value
+    return env
+
+
+def _parse_env_line(raw_line: str) -> tuple[str, str] | None:
+    # File iteration keeps the trailing newline; drop it so error messages
+    # stay on one line.
+    raw_line = raw_line.rstrip("\n")
+    line = raw_line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith(_EXPORT_PREFIX):
+        line = line[_EXPORT_PREFIX_LEN:].strip()
+    if "=" not in line:
+        raise RmmError(f"Invalid env line (expected KEY=VALUE): {raw_line}")
+    key, value = line.split("=", 1)
+    key = key.strip()
+    value = value.strip()
+    if not key:
+        raise RmmError(f"Invalid env line (empty key): {raw_line}")
+    if value.startswith(("'", '"')):
+        quote = value[0]
+        if len(value) >= 2 and value[-1] == quote and quote not in value[1:-1] and "\\" not in value:
+            # Fast path: one fully-quoted value with no embedded quotes or
+            # escapes — just drop the outer quotes, no lexer needed.
+            value = value[1:-1]
+        else:
             try:
-                # shlex handles simple quoted strings and escapes
+                # shlex handles escape-containing quoted strings
                 parsed = shlex.split(value, posix=True)
                 if len(parsed) == 1:
                     value = parsed[0]
             except ValueError:
                 # Fall back to raw value if quoting is malformed
                 pass
-        env[key] = value
-    return env
+    return key, value
 
 
 @dataclass(frozen=True)
@@ -153,18 +232,43 @@ class MonitorValidationResult:
 
 
 def validate_monitor_output(text: str, output_var: str) -> MonitorValidationResult:
-    errors: list[str] = []
-    output_var = validate_output_var(output_var)
+    # 'in' dispatches to C substring search, so absent markers are detected
+    # without paying for splitlines() plus a per-line strip over the text.
+    missing = [marker for marker in _MONITOR_MARKERS if marker not in text]
+    if missing:
+        return MonitorValidationResult(
+            ok=False,
+            errors=[f"Expected exactly one '{marker}' line." for marker in missing],
+        )
+    return validate_monitor_output_lines(text.splitlines(), output_var=output_var)
 
-    lines = text.splitlines()
 
-    def find_all(marker: str) -> list[int]:
-        return [idx for idx, line in enumerate(lines) if line.strip() == marker]
+def validate_monitor_output_lines(iter_lines: Iterable[str], output_var: str) -> MonitorValidationResult:
+    errors: list[str] = []
 
-    diag_start = find_all("<-Start Diagnostic->")
-    diag_end = find_all("<-End Diagnostic->")
-    res_start = find_all("<-Start Result->")
-    res_end = find_all("<-End Result->")
+    markers: dict[str, list[int]] = {marker: [] for marker in _MONITOR_MARKERS}
+    result_lines: list[str] = []
+    in_result = False
+    for idx, line in enumerate(iter_lines):
+        stripped = line.strip()
+        hits = markers.get(stripped)
+        if hits is not None:
+            hits.append(idx)
+            if stripped == "<-Start Result->":
+                in_result = True
+            elif stripped == "<-End Result->":
+                in_result = False
+                # Everything after a well-formed End Result is ignored by Datto,
+                # so stop scanning once all four markers have been seen.
+                if all(markers.values()):
+                    break
+        elif in_result:
+            result_lines.append(line.rstrip("\n"))
+
+    diag_start = markers["<-Start Diagnostic->"]
+    diag_end = markers["<-End Diagnostic->"]
+    res_start = markers["<-Start Result->"]
+    res_end = markers["<-End Result->"]
 
     if len(diag_start) != 1:
         errors.append("Expected exactly one '<-Start Diagnostic->' line.")
@@ -185,14 +289,21 @@ def validate_monitor_output(text: str, output_var: str) -> MonitorValidationResu
         )
         return MonitorValidationResult(ok=False, errors=errors)
 
-    result_lines = [line.rstrip("\n") for line in lines[rs + 1 : re_]]
-    non_empty = [ln for ln in result_lines if ln.strip() != ""]
-    if not non_empty:
+    prefix = output_var + "="
+    matching: list[str] = []
+    other_lines: list[str] = []
+    for ln in result_lines:
+        if ln.strip() == "":
+            continue
+        if ln.startswith(prefix) and len(ln) > len(prefix):
+            matching.append(ln)
+        else:
+            other_lines.append(ln)
+
+    if not matching and not other_lines:
         errors.append("Result block is empty; expected one output variable line.")
         return MonitorValidationResult(ok=False, errors=errors)
 
-    pattern = re.compile(rf"^{re.escape(output_var)}=.+$")
-    matching = [ln for ln in non_empty if pattern.match(ln)]
     if len(matching) != 1:
         errors.append(
             f"Expected exactly one '{output_var}=...' line inside the result block; found {len(matching)}."
@@ -200,7 +311,6 @@ def validate_monitor_output(text: str, output_var: str) -> MonitorValidationResu
         errors.append("Example: Status=OK: All checks passed")
         return MonitorValidationResult(ok=False, errors=errors)
 
-    other_lines = [ln for ln in non_empty if ln is not matching[0]]
     if other_lines:
         errors.append("Result block must contain exactly one non-empty line (the output variable line).")
         errors.append(f"Unexpected additional lines: {other_lines}")
@@ -223,8 +333,6 @@ def cmd_scaffold(args: argparse.Namespace) -> int:
     dry_run: bool = args.dry_run
 
     filename = normalize_kebab(raw_name)
-    if category == "monitors":
-        output_var = validate_output_var(output_var)
 
     dest = destination_path(os_name=os_name, category=category, filename=filename)
     tmpl_path = template_path(os_name=os_name, category=category)
@@ -243,11 +351,14 @@ def cmd_scaffold(args: argparse.Namespace) -> int:
         "OUTPUT_VAR": output_var,
         "VERSION": args.version,
     }
-    rendered = render_template(tmpl_path.read_text(encoding="utf-8"), subs)
+    rendered = render_template(load_template(tmpl_path), subs)
+
+    dest_rel = dest.relative_to(REPO_ROOT)
+    rmm_py = Path("skills/datto-rmm-component-dev/scripts/rmm.py")
 
     print(f"Repo root: {REPO_ROOT}")
     print(f"Template:  {tmpl_path.relative_to(REPO_ROOT)}")
-    print(f"Target:    {dest.relative_to(REPO_ROOT)}")
+    print(f"Target:    {dest_rel}")
 
     if dry_run:
         print("Dry run: not writing files.")
@@ -260,13 +371,11 @@ def cmd_scaffold(args: argparse.Namespace) -> int:
 
     print("")
     print("Next steps:")
-    print(f"- Edit: {dest.relative_to(REPO_ROOT)}")
-    print(
-        f"- Run locally: python3 {Path('skills/datto-rmm-component-dev/scripts/rmm.py')} run --script {dest.relative_to(REPO_ROOT)}"
-    )
+    print(f"- Edit: {dest_rel}")
+    print(f"- Run locally: python3 {rmm_py} run --script {dest_rel}")
     if category == "monitors":
         print(
-            f"- Validate output: python3 {Path('skills/datto-rmm-component-dev/scripts/rmm.py')} run --script {dest.relative_to(REPO_ROOT)} --validate-monitor --output-var {output_var}"
+            f"- Validate output: python3 {rmm_py} run --script {dest_rel} --validate-monitor --output-var {output_var}"
         )
         print(f"- Ensure Datto monitor Output Variable is set to: {output_var}")
 
@@ -276,14 +385,13 @@ def cmd_scaffold(args: argparse.Namespace) -> int:
 def cmd_validate_monitor_output(args: argparse.Namespace) -> int:
     output_var = args.output_var
     if args.input == "-":
-        text = sys.stdin.read()
+        result = validate_monitor_output_lines(sys.stdin, output_var=output_var)
         source = "<stdin>"
     else:
         path = Path(args.input)
-        text = path.read_text(encoding="utf-8", errors="replace")
+        with open_text_for_read(path) as f:
+            result = validate_monitor_output_lines(f, output_var=output_var)
         source = str(path)
-
-    result = validate_monitor_output(text, output_var=output_var)
     if result.ok:
         print(f"OK: Monitor output is valid ({source})")
         return 0
@@ -325,32 +433,37 @@ def cmd_run(args: argparse.Namespace) -> int:
 
     print(f"Workdir: {workdir}")
     print(f"Script:  {script_path}")
-    print(f"Cmd:     {' '.join(shlex.quote(c) for c in cmd)}")
+    # Shell-quoting is only for humans copy-pasting from a terminal.
+    cmd_display = " ".join(shlex.quote(c) for c in cmd) if sys.stdout.isatty() else " ".join(cmd)
+    print(f"Cmd:     {cmd_display}")
+
+    should_validate = bool(args.validate_monitor)
+    if not should_validate and "Monitors" in script_path.parts:
+        should_validate = True
 
     try:
         with stdout_path.open("wb") as stdout_f, stderr_path.open("wb") as stderr_f:
-            proc = subprocess.run(
+            # Redirect straight to files: reading stdout through a pipe would
+            # block until every writer exits, hanging on scripts that leave a
+            # background child (or daemon) attached to stdout.
+            returncode = subprocess.run(
                 cmd,
                 cwd=str(workdir),
                 env=env,
                 stdout=stdout_f,
                 stderr=stderr_f,
                 check=False,
-            )
+            ).returncode
     except FileNotFoundError as exc:
         raise RmmError(f"Command not found: {cmd[0]} (install it and try again)") from exc
 
-    print(f"Exit code: {proc.returncode}")
+    print(f"Exit code: {returncode}")
     print(f"Stdout:    {stdout_path}")
     print(f"Stderr:    {stderr_path}")
 
-    should_validate = bool(args.validate_monitor)
-    if not should_validate and "Monitors" in script_path.parts:
-        should_validate = True
-
     if should_validate:
-        stdout_text = stdout_path.read_text(encoding="utf-8", errors="replace")
-        validation = validate_monitor_output(stdout_text, output_var=output_var)
+        with open_text_for_read(stdout_path) as stdout_text_f:
+            validation = validate_monitor_output_lines(stdout_text_f, output_var=output_var)
         if validation.ok:
             print(f"Monitor output: OK ({output_var}=...)")
         else:
@@ -358,10 +471,10 @@ def cmd_run(args: argparse.Namespace) -> int:
             for err in validation.errors:
                 eprint(f"- {err}")
             # If the script itself already failed, keep its exit code. Otherwise, surface validation failure.
-            if proc.returncode == 0:
+            if returncode == 0:
                 return 2
 
-    return proc.returncode
+    return returncode
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -372,7 +485,7 @@ def build_parser() -> argparse.ArgumentParser:
     scaffold.add_argument("--os", required=True, choices=["windows", "macos", "linux"])
     scaffold.add_argument("--category", required=True, choices=["applications", "scripts", "monitors"])
     scaffold.add_argument("--name", required=True, help="Component name (normalized to kebab-case filename)")
-    scaffold.add_argument("--output-var", default="Status", help="Monitor output variable name (default: Status)")
+    scaffold.add_argument("--output-var", default="Status", type=_output_var_arg, help="Monitor output variable name (default: Status)")
     scaffold.add_argument("--version", default="0.1.0", help="Component build/version placeholder")
     scaffold.add_argument("--force", action="store_true", help="Overwrite an existing file if present")
     scaffold.add_argument("--dry-run", action="store_true", help="Print intended actions without writing files")
@@ -384,7 +497,7 @@ def build_parser() -> argparse.ArgumentParser:
     run.add_argument("--workdir", help="Working directory for execution (default: temp dir)")
     run.add_argument("--attachments", help="Directory of files to copy into workdir (simulate Datto attachments)")
     run.add_argument("--validate-monitor", action="store_true", help="Validate monitor markers/output line")
-    run.add_argument("--output-var", default="Status", help="Monitor output variable name (default: Status)")
+    run.add_argument("--output-var", default="Status", type=_output_var_arg, help="Monitor output variable name (default: Status)")
     run.set_defaults(func=cmd_run)
 
     validate = sub.add_parser("validate-monitor-output", help="Validate Datto monitor output markers and result line")
@@ -393,7 +506,7 @@ def build_parser() -> argparse.ArgumentParser:
         required=True,
         help="File path to validate, or '-' to read from stdin",
     )
-    validate.add_argument("--output-var", default="Status", help="Monitor output variable name (default: Status)")
+    validate.add_argument("--output-var", default="Status", type=_output_var_arg, help="Monitor output variable name (default: Status)")
     validate.set_defaults(func=cmd_validate_monitor_output)
 
     return parser